@@ -1,10 +1,22 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+import multiprocessing
 import pandas as pd
 import io
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
 import joblib
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.preprocessing import StandardScaler
@@ -12,7 +24,21 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, roc_auc_score
 from pathlib import Path
 
-app = FastAPI(title="Heart Disease Prediction API")
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run the batch job worker for the lifetime of the server."""
+    start_batch_job_worker()
+    yield
+    stop_batch_job_worker()
+
+
+app = FastAPI(title="Heart Disease Prediction API", lifespan=lifespan)
 
 origins = [
     "http://localhost:3000",
@@ -41,6 +67,14 @@ app.add_middleware(
 # Constants for file paths
 MODEL_PATH = Path("../models/best_model.pkl")
 SCALER_PATH = Path("../models/scaler.pkl")
+JOBS_DIR = Path("../jobs")
+
+# Batch job settings
+BATCH_JOB_CHUNK_SIZE = 1000
+BATCH_JOB_WORKERS = os.cpu_count() or 1
+BATCH_JOB_MAX_RETRIES = 3
+BATCH_JOB_RETENTION_SECONDS = float(os.getenv("BATCH_JOB_RETENTION_SECONDS", 7 * 24 * 60 * 60))
+BATCH_JOB_ORPHAN_SECONDS = 60 * 60
 
 
 class PredictionInput(BaseModel):
@@ -77,6 +111,14 @@ class BatchPredictionResponse(BaseModel):
     probabilities: List[float]
 
 
+class BatchJobResponse(BaseModel):
+    job_id: str
+    status: str
+    total_rows: Optional[int] = None
+    processed_rows: int = 0
+    error: Optional[str] = None
+
+
 class ModelMetrics(BaseModel):
     accuracy: float
     precision: float
@@ -102,6 +144,13 @@ def load_model_and_scaler():
         raise RuntimeError(f"Error loading model or scaler: {str(e)}")
 
 
+def save_artifact(obj, path: Path):
+    """Atomically save a model or scaler so readers never see a partial file."""
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    joblib.dump(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
 def preprocess_data(data: pd.DataFrame, scaler: StandardScaler, fit: bool = False):
     """Preprocess input data using the scaler."""
     if fit:
@@ -176,6 +225,64 @@ def get_column_mapping():
     }
 
 
+def match_batch_columns(columns):
+    """Match uploaded column names to standardized names.
+
+    Returns a tuple of (matches, missing) where matches maps each
+    standardized name to the uploaded column that provides it.
+    """
+    matches = {}
+    missing_columns = []
+
+    for standard_name, possible_names in get_column_mapping().items():
+        # Find matching column in data
+        matching_col = None
+        for possible_name in possible_names:
+            if possible_name in columns:
+                matching_col = possible_name
+                break
+
+        if matching_col is not None:
+            matches[standard_name] = matching_col
+        else:
+            missing_columns.append(standard_name)
+
+    return matches, missing_columns
+
+
+def missing_columns_message(missing_columns):
+    """Build the error message for a CSV that lacks required columns."""
+    return f"Missing required columns. Please ensure your CSV contains columns for: {', '.join(missing_columns)}"
+
+
+def standardize_batch_data(data: pd.DataFrame) -> pd.DataFrame:
+    """Create a DataFrame with the exact column names used during training."""
+    matches, missing_columns = match_batch_columns(data.columns)
+
+    if missing_columns:
+        raise ValueError(missing_columns_message(missing_columns))
+
+    standardized_data = pd.DataFrame()
+    for standard_name, matching_col in matches.items():
+        standardized_data[standard_name] = data[matching_col]
+
+    # Ensure numeric data types
+    for col in standardized_data.columns:
+        standardized_data[col] = pd.to_numeric(standardized_data[col], errors='coerce')
+
+    # Check for any NaN values
+    if standardized_data.isna().any().any():
+        raise ValueError("Some required values are missing or invalid in your CSV file")
+
+    # Ensure columns are in the correct order
+    expected_columns = [
+        'age', 'sex', 'chest pain type', 'resting bp s', 'cholesterol',
+        'fasting blood sugar', 'resting ecg', 'max heart rate',
+        'exercise angina', 'oldpeak', 'ST slope'
+    ]
+    return standardized_data[expected_columns]
+
+
 @app.post("/predict/batch", response_model=BatchPredictionResponse)
 async def predict_batch(file: UploadFile = File(...)):
     """Make predictions for multiple instances from CSV file."""
@@ -187,44 +294,8 @@ async def predict_batch(file: UploadFile = File(...)):
         # Store names if available, otherwise use index
         names = data.get('name', [f"Patient_{i}" for i in range(len(data))]).tolist()
 
-        # Get column mapping
-        column_mapping = get_column_mapping()
-        
-        # Create standardized DataFrame with exact column names used during training
-        standardized_data = pd.DataFrame()
-        missing_columns = []
-
-        for standard_name, possible_names in column_mapping.items():
-            # Find matching column in data
-            matching_col = None
-            for possible_name in possible_names:
-                if possible_name in data.columns:
-                    matching_col = possible_name
-                    break
-            
-            if matching_col is not None:
-                standardized_data[standard_name] = data[matching_col]
-            else:
-                missing_columns.append(standard_name)
-
-        if missing_columns:
-            raise ValueError(f"Missing required columns. Please ensure your CSV contains columns for: {', '.join(missing_columns)}")
-
-        # Ensure numeric data types
-        for col in standardized_data.columns:
-            standardized_data[col] = pd.to_numeric(standardized_data[col], errors='coerce')
-
-        # Check for any NaN values
-        if standardized_data.isna().any().any():
-            raise ValueError("Some required values are missing or invalid in your CSV file")
-
-        # Ensure columns are in the correct order
-        expected_columns = [
-            'age', 'sex', 'chest pain type', 'resting bp s', 'cholesterol',
-            'fasting blood sugar', 'resting ecg', 'max heart rate',
-            'exercise angina', 'oldpeak', 'ST slope'
-        ]
-        standardized_data = standardized_data[expected_columns]
+        # Map, validate and order the columns used during training
+        standardized_data = standardize_batch_data(data)
 
         # Preprocess data
         X_scaled = preprocess_data(standardized_data, scaler)
@@ -248,6 +319,338 @@ async def predict_batch(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"An error occurred while processing the file: {str(e)}")
 
 
+def job_dir(job_id: str) -> Path:
+    """Get the spool directory of a batch job."""
+    return JOBS_DIR / job_id
+
+
+def read_job_state(job_id: str) -> dict:
+    """Read the persisted state of a batch job."""
+    with open(job_dir(job_id) / "job.json") as f:
+        return json.load(f)
+
+
+def write_job_state(state: dict):
+    """Atomically persist the state of a batch job."""
+    path = job_dir(state['job_id']) / "job.json"
+    tmp_path = path.with_suffix(".json.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def new_job_state(job_id: str, filename: str) -> dict:
+    """Build the initial state of a queued batch job."""
+    return {
+        'job_id': job_id,
+        'status': 'queued',
+        'filename': filename,
+        'created_at': time.time(),
+        'total_rows': None,
+        'processed_rows': 0,
+        'results_offset': 0,
+        'retries': 0,
+        'finished_at': None,
+        'error': None
+    }
+
+
+def load_batch_job(job_id: str) -> dict:
+    """Load a batch job's state or raise a 404 if it does not exist."""
+    try:
+        uuid.UUID(hex=job_id)
+        return read_job_state(job_id)
+    except (ValueError, FileNotFoundError):
+        raise HTTPException(status_code=404, detail=f"Batch job {job_id} not found")
+
+
+def init_batch_worker():
+    """Score on a single core per worker, since the pool already spans all cores."""
+    # The model and scaler were loaded from disk when this process imported the app
+    model.n_jobs = 1
+
+
+def score_batch_chunk(start_row: int, chunk: pd.DataFrame) -> pd.DataFrame:
+    """Score one chunk of a batch job inside a worker process."""
+    # Store names if available, otherwise use the row index within the file
+    if 'name' in chunk.columns:
+        names = chunk['name'].tolist()
+    else:
+        names = [f"Patient_{i}" for i in range(start_row, start_row + len(chunk))]
+
+    standardized_data = standardize_batch_data(chunk)
+    X_scaled = preprocess_data(standardized_data, scaler)
+
+    return pd.DataFrame({
+        'name': names,
+        'prediction': model.predict(X_scaled),
+        'probability': model.predict_proba(X_scaled)[:, 1]
+    })
+
+
+def write_batch_job_chunk(state: dict, results, chunk_result: pd.DataFrame):
+    """Append a scored chunk to the result file and checkpoint progress."""
+    results.write(chunk_result.to_csv(header=False, index=False).encode('utf-8'))
+    results.flush()
+    os.fsync(results.fileno())
+
+    state['processed_rows'] += len(chunk_result)
+    state['results_offset'] = results.tell()
+    write_job_state(state)
+
+
+def run_batch_job(job_id: str):
+    """Score a spooled batch file in parallel chunks, resuming from the last checkpoint."""
+    state = read_job_state(job_id)
+    if state['status'] not in ('queued', 'running'):
+        return
+
+    input_path = job_dir(job_id) / "input.csv"
+    results_path = job_dir(job_id) / "results.csv"
+    pending = deque()
+
+    try:
+        if state['total_rows'] is None:
+            state['total_rows'] = sum(
+                len(chunk) for chunk in pd.read_csv(input_path, usecols=[0], chunksize=BATCH_JOB_CHUNK_SIZE)
+            )
+        state['status'] = 'running'
+        write_job_state(state)
+
+        reader = pd.read_csv(input_path, chunksize=BATCH_JOB_CHUNK_SIZE)
+
+        with ProcessPoolExecutor(
+            max_workers=BATCH_JOB_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_batch_worker
+        ) as executor, open(results_path, 'a+b') as results:
+            # Drop anything written after the last checkpoint
+            results.truncate(state['results_offset'])
+            if state['results_offset'] == 0:
+                results.write(b"name,prediction,probability\n")
+                results.flush()
+                state['results_offset'] = results.tell()
+                write_job_state(state)
+
+            try:
+                start_row = 0
+                for chunk in reader:
+                    # Skip records already scored before a restart
+                    if start_row + len(chunk) <= state['processed_rows']:
+                        start_row += len(chunk)
+                        continue
+                    if start_row < state['processed_rows']:
+                        chunk = chunk.iloc[state['processed_rows'] - start_row:]
+                        start_row = state['processed_rows']
+
+                    pending.append(executor.submit(score_batch_chunk, start_row, chunk))
+                    start_row += len(chunk)
+
+                    # Keep a bounded number of chunks in flight, writing them in order
+                    if len(pending) >= BATCH_JOB_WORKERS * 2:
+                        write_batch_job_chunk(state, results, pending.popleft().result())
+
+                while pending:
+                    write_batch_job_chunk(state, results, pending.popleft().result())
+            finally:
+                for future in pending:
+                    future.cancel()
+
+        if state['processed_rows'] != state['total_rows']:
+            raise ValueError(
+                f"Scored {state['processed_rows']} rows but the file contains {state['total_rows']}")
+
+        state['status'] = 'completed'
+    except BrokenProcessPool as e:
+        # A worker process died, so retry from the last checkpoint
+        state['retries'] += 1
+        if state['retries'] <= BATCH_JOB_MAX_RETRIES:
+            write_job_state(state)
+            batch_job_queue.put(job_id)
+            return
+        state['status'] = 'failed'
+        state['error'] = f"Batch job workers crashed {state['retries']} times: {str(e)}"
+    except pd.errors.ParserError:
+        state['status'] = 'failed'
+        state['error'] = "Invalid CSV file format"
+    except ValueError as e:
+        state['status'] = 'failed'
+        state['error'] = str(e)
+    except Exception as e:
+        state['status'] = 'failed'
+        state['error'] = f"An error occurred while processing the file: {str(e)}"
+
+    state['finished_at'] = time.time()
+    write_job_state(state)
+
+
+def try_lock_file(lock_file) -> bool:
+    """Take a non-blocking exclusive lock that is released when the file is closed."""
+    try:
+        if os.name == 'nt':
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def run_locked_batch_job(job_id: str):
+    """Run a batch job unless another server process already holds its lock."""
+    with open(job_dir(job_id) / "lock", 'a') as lock_file:
+        if try_lock_file(lock_file):
+            run_batch_job(job_id)
+
+
+def sweep_batch_jobs():
+    """Delete finished jobs past the retention period and abandoned uploads."""
+    now = time.time()
+    for directory in JOBS_DIR.iterdir():
+        if not directory.is_dir():
+            continue
+
+        if (directory / "job.json").exists():
+            state = read_job_state(directory.name)
+            expired = (
+                state['status'] in ('completed', 'failed')
+                and now - state['finished_at'] > BATCH_JOB_RETENTION_SECONDS
+            )
+        else:
+            # Left behind when the server stopped during an upload
+            last_modified = max(
+                [directory.stat().st_mtime] + [path.stat().st_mtime for path in directory.iterdir()]
+            )
+            expired = now - last_modified > BATCH_JOB_ORPHAN_SECONDS
+
+        if expired:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+batch_job_queue = queue.Queue()
+
+
+def batch_job_worker():
+    """Run queued batch jobs one at a time."""
+    while True:
+        job_id = batch_job_queue.get()
+        try:
+            if job_id is None:
+                return
+            run_locked_batch_job(job_id)
+            sweep_batch_jobs()
+        except Exception as e:
+            print(f"Error in batch job {job_id}: {str(e)}")
+        finally:
+            batch_job_queue.task_done()
+
+
+def requeue_unfinished_batch_jobs():
+    """Queue jobs left queued or running by a previous server process."""
+    unfinished_jobs = []
+    for state_path in JOBS_DIR.glob("*/job.json"):
+        state = read_job_state(state_path.parent.name)
+        if state['status'] in ('queued', 'running'):
+            unfinished_jobs.append(state)
+
+    for state in sorted(unfinished_jobs, key=lambda s: s['created_at']):
+        batch_job_queue.put(state['job_id'])
+
+
+def start_batch_job_worker():
+    """Clean up old jobs, requeue unfinished ones and start the batch job worker."""
+    JOBS_DIR.mkdir(parents=True, exist_ok=True)
+    sweep_batch_jobs()
+    requeue_unfinished_batch_jobs()
+    threading.Thread(target=batch_job_worker, daemon=True).start()
+
+
+def stop_batch_job_worker():
+    """Stop the batch job worker once it finishes its current job."""
+    batch_job_queue.put(None)
+
+
+@app.post("/predict/batch/jobs", response_model=BatchJobResponse, status_code=202)
+async def create_batch_job(file: UploadFile = File(...)):
+    """Spool a CSV file to disk and queue it for asynchronous batch scoring."""
+    job_id = uuid.uuid4().hex
+    directory = job_dir(job_id)
+    directory.mkdir(parents=True)
+
+    try:
+        try:
+            # Spool the upload to disk without holding it in memory
+            with open(directory / "input.csv", 'wb') as f:
+                while True:
+                    contents = await file.read(1024 * 1024)
+                    if not contents:
+                        break
+                    f.write(contents)
+
+            # Validate the header up front so bad files fail fast
+            first_rows = pd.read_csv(directory / "input.csv", nrows=1)
+            _, missing_columns = match_batch_columns(first_rows.columns)
+            if missing_columns:
+                raise ValueError(missing_columns_message(missing_columns))
+            if first_rows.empty:
+                raise ValueError("The uploaded CSV file contains no rows")
+        except Exception:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+
+        state = new_job_state(job_id, file.filename)
+        write_job_state(state)
+        batch_job_queue.put(job_id)
+
+        return BatchJobResponse(**state)
+    except pd.errors.EmptyDataError:
+        raise HTTPException(status_code=400, detail="The uploaded CSV file is empty")
+    except pd.errors.ParserError:
+        raise HTTPException(status_code=400, detail="Invalid CSV file format")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occurred while processing the file: {str(e)}")
+
+
+@app.get("/predict/batch/jobs/{job_id}", response_model=BatchJobResponse)
+async def get_batch_job(job_id: str):
+    """Get the status and progress of a batch job."""
+    return BatchJobResponse(**load_batch_job(job_id))
+
+
+@app.get("/predict/batch/jobs/{job_id}/results")
+async def get_batch_job_results(job_id: str):
+    """Download the results scored so far for a batch job as CSV."""
+    state = load_batch_job(job_id)
+    results_path = job_dir(job_id) / "results.csv"
+    if state['results_offset'] == 0 or not results_path.exists():
+        raise HTTPException(status_code=404, detail="No results are available yet for this batch job")
+
+    def iter_results(size=state['results_offset']):
+        # Only serve rows up to the last checkpoint
+        with open(results_path, 'rb') as f:
+            while size > 0:
+                contents = f.read(min(size, 1024 * 1024))
+                if not contents:
+                    break
+                size -= len(contents)
+                yield contents
+
+    return StreamingResponse(
+        iter_results(),
+        media_type="text/csv",
+        headers={
+            "Content-Disposition": f'attachment; filename="{job_id}_results.csv"',
+            "X-Job-Status": state['status'],
+            "X-Processed-Rows": str(state['processed_rows']),
+            "X-Total-Rows": "" if state['total_rows'] is None else str(state['total_rows'])
+        }
+    )
+
+
 def calculate_metrics(model, X_test, y_test, X_train) -> ModelMetrics:
     """Calculate model performance metrics."""
     y_pred = model.predict(X_test)
@@ -288,8 +691,8 @@ async def retrain_model_task(training_data: pd.DataFrame):
         metrics = calculate_metrics(new_model, X_test_scaled, y_test, X_train)
 
         # Save the new model and scaler
-        joblib.dump(new_model, MODEL_PATH)
-        joblib.dump(scaler, SCALER_PATH)
+        save_artifact(new_model, MODEL_PATH)
+        save_artifact(scaler, SCALER_PATH)
 
         # Update the global model reference
         global model
@@ -0,0 +1,9 @@
+import os
+import sys
+from pathlib import Path
+
+# The app resolves ../models relative to the working directory, so run the
+# tests from backend/ just like the server
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+os.chdir(BACKEND_DIR)
+sys.path.insert(0, str(BACKEND_DIR))
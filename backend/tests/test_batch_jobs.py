@@ -0,0 +1,254 @@
+import io
+import os
+import time
+import uuid
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+import app as api
+
+SAMPLE_CSV = Path("../data/test datasets/bulk_predict_heart_desease_dataset_15rows_names.csv")
+
+
+@pytest.fixture
+def batch_csv():
+    """The sample batch file with a blank line, which pandas skips."""
+    lines = SAMPLE_CSV.read_text().splitlines()
+    return "\n".join(lines[:4] + [""] + lines[4:]) + "\n"
+
+
+@pytest.fixture(autouse=True)
+def jobs_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(api, "JOBS_DIR", tmp_path)
+    monkeypatch.setattr(api, "BATCH_JOB_CHUNK_SIZE", 4)
+    monkeypatch.setattr(api, "BATCH_JOB_WORKERS", 2)
+    return tmp_path
+
+
+@pytest.fixture(autouse=True)
+def empty_job_queue():
+    yield
+    while not api.batch_job_queue.empty():
+        api.batch_job_queue.get_nowait()
+        api.batch_job_queue.task_done()
+
+
+def create_job(contents, **state):
+    job_id = uuid.uuid4().hex
+    api.job_dir(job_id).mkdir()
+    (api.job_dir(job_id) / "input.csv").write_text(contents)
+    api.write_job_state({**api.new_job_state(job_id, "input.csv"), **state})
+    return job_id
+
+
+def results_path(job_id):
+    return api.job_dir(job_id) / "results.csv"
+
+
+def rewind_job(job_id, records):
+    """Rewind a finished job to a checkpoint, leaving a partly written row behind as a crash would."""
+    lines = results_path(job_id).read_bytes().splitlines(keepends=True)
+    checkpoint = b"".join(lines[:records + 1])
+    results_path(job_id).write_bytes(checkpoint + b"Garbage,1,0.")
+
+    state = api.read_job_state(job_id)
+    state.update(status='running', processed_rows=records, results_offset=len(checkpoint), finished_at=None)
+    api.write_job_state(state)
+
+
+def wait_for_job(client, job_id, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        state = client.get(f"/predict/batch/jobs/{job_id}").json()
+        if state['status'] in ('completed', 'failed'):
+            return state
+        time.sleep(0.2)
+    raise AssertionError(f"Batch job {job_id} did not finish")
+
+
+def crash_chunk(start_row, chunk):
+    """Stand-in for score_batch_chunk that kills its worker process."""
+    os._exit(1)
+
+
+def test_batch_job_matches_predict_batch(batch_csv):
+    job_id = create_job(batch_csv)
+    api.run_batch_job(job_id)
+
+    state = api.read_job_state(job_id)
+    assert state['status'] == 'completed'
+    assert state['processed_rows'] == state['total_rows'] == 15
+
+    response = TestClient(api.app).post(
+        "/predict/batch", files={"file": ("batch.csv", batch_csv.encode('utf-8'))})
+    expected = response.json()
+    results = pd.read_csv(results_path(job_id))
+    assert results['name'].tolist() == expected['names']
+    assert results['prediction'].tolist() == expected['predictions']
+    assert results['probability'].tolist() == pytest.approx(expected['probabilities'])
+
+
+def test_batch_job_resumes_from_checkpoint(batch_csv):
+    job_id = create_job(batch_csv)
+    api.run_batch_job(job_id)
+    expected = results_path(job_id).read_bytes()
+
+    # Past the blank line and part way through a chunk
+    rewind_job(job_id, 6)
+    api.run_batch_job(job_id)
+
+    state = api.read_job_state(job_id)
+    assert state['status'] == 'completed'
+    assert state['processed_rows'] == state['total_rows'] == 15
+    assert results_path(job_id).read_bytes() == expected
+
+
+def test_unfinished_batch_job_completes_after_restart(batch_csv):
+    job_id = create_job(batch_csv)
+    api.run_batch_job(job_id)
+    expected = results_path(job_id).read_bytes()
+    rewind_job(job_id, 6)
+
+    with TestClient(api.app) as client:
+        state = wait_for_job(client, job_id)
+        response = client.get(f"/predict/batch/jobs/{job_id}/results")
+
+    assert state == {
+        'job_id': job_id, 'status': 'completed', 'total_rows': 15, 'processed_rows': 15, 'error': None}
+    assert response.content == expected
+
+
+def test_batch_job_failure_keeps_earlier_chunks():
+    data = pd.read_csv(SAMPLE_CSV)
+    data['cholesterol'] = data['cholesterol'].astype(str)
+    data.loc[9, 'cholesterol'] = "unknown"
+
+    with TestClient(api.app) as client:
+        response = client.post(
+            "/predict/batch/jobs", files={"file": ("batch.csv", data.to_csv(index=False).encode('utf-8'))})
+        assert response.status_code == 202
+        job_id = response.json()['job_id']
+
+        state = wait_for_job(client, job_id)
+        response = client.get(f"/predict/batch/jobs/{job_id}/results")
+
+    assert state['status'] == 'failed'
+    assert state['error'] == "Some required values are missing or invalid in your CSV file"
+    assert state['processed_rows'] == 8
+    assert response.status_code == 200
+    assert pd.read_csv(io.StringIO(response.text))['name'].tolist() == data['name'][:8].tolist()
+
+
+def test_get_batch_job_reports_progress(batch_csv):
+    job_id = create_job(batch_csv, status='running', total_rows=15, processed_rows=4)
+    client = TestClient(api.app)
+
+    assert client.get(f"/predict/batch/jobs/{job_id}").json() == {
+        'job_id': job_id, 'status': 'running', 'total_rows': 15, 'processed_rows': 4, 'error': None}
+    assert client.get(f"/predict/batch/jobs/{uuid.uuid4().hex}").status_code == 404
+    assert client.get("/predict/batch/jobs/not-a-job-id").status_code == 404
+
+
+def test_batch_job_results_stop_at_checkpoint(batch_csv):
+    job_id = create_job(batch_csv)
+    client = TestClient(api.app)
+    assert client.get(f"/predict/batch/jobs/{job_id}/results").status_code == 404
+
+    checkpoint = b"name,prediction,probability\nPaula Young,1,0.67\n"
+    results_path(job_id).write_bytes(checkpoint + b"Jason Brady,1,0.")
+    api.write_job_state({
+        **api.read_job_state(job_id),
+        'status': 'running', 'total_rows': 15, 'processed_rows': 1, 'results_offset': len(checkpoint)
+    })
+
+    response = client.get(f"/predict/batch/jobs/{job_id}/results")
+    assert response.status_code == 200
+    assert response.content == checkpoint
+    assert response.headers['x-job-status'] == 'running'
+    assert response.headers['x-processed-rows'] == '1'
+    assert response.headers['x-total-rows'] == '15'
+
+
+def test_unfinished_batch_jobs_are_requeued_in_order(batch_csv):
+    running = create_job(batch_csv, status='running', created_at=2)
+    create_job(batch_csv, status='completed', created_at=3, finished_at=time.time())
+    queued = create_job(batch_csv, status='queued', created_at=1)
+    create_job(batch_csv, status='failed', created_at=0, finished_at=time.time())
+
+    api.requeue_unfinished_batch_jobs()
+
+    requeued = []
+    while not api.batch_job_queue.empty():
+        requeued.append(api.batch_job_queue.get_nowait())
+        api.batch_job_queue.task_done()
+    assert requeued == [queued, running]
+
+
+def test_crashed_worker_requeues_batch_job(batch_csv, monkeypatch):
+    monkeypatch.setattr(api, "score_batch_chunk", crash_chunk)
+    monkeypatch.setattr(api, "BATCH_JOB_MAX_RETRIES", 1)
+    job_id = create_job(batch_csv)
+
+    api.run_batch_job(job_id)
+
+    state = api.read_job_state(job_id)
+    assert state['status'] == 'running'
+    assert state['retries'] == 1
+    assert api.batch_job_queue.get_nowait() == job_id
+    api.batch_job_queue.task_done()
+
+    api.run_batch_job(job_id)
+
+    state = api.read_job_state(job_id)
+    assert state['status'] == 'failed'
+    assert state['retries'] == 2
+    assert api.batch_job_queue.empty()
+
+
+def test_sweep_removes_expired_and_abandoned_jobs(batch_csv, monkeypatch):
+    monkeypatch.setattr(api, "BATCH_JOB_RETENTION_SECONDS", 60)
+    now = time.time()
+    expired = create_job(batch_csv, status='completed', finished_at=now - 120)
+    recent = create_job(batch_csv, status='failed', finished_at=now)
+    running = create_job(batch_csv, status='running', created_at=now - 120)
+
+    abandoned = api.job_dir(uuid.uuid4().hex)
+    abandoned.mkdir()
+    (abandoned / "input.csv").write_text(batch_csv)
+    old = now - api.BATCH_JOB_ORPHAN_SECONDS - 60
+    os.utime(abandoned / "input.csv", (old, old))
+    os.utime(abandoned, (old, old))
+
+    uploading = api.job_dir(uuid.uuid4().hex)
+    uploading.mkdir()
+    (uploading / "input.csv").write_text(batch_csv)
+
+    api.sweep_batch_jobs()
+
+    assert not api.job_dir(expired).exists()
+    assert api.job_dir(recent).exists()
+    assert api.job_dir(running).exists()
+    assert not abandoned.exists()
+    assert uploading.exists()
+
+
+def test_locked_batch_job_is_skipped(batch_csv):
+    job_id = create_job(batch_csv)
+    with open(api.job_dir(job_id) / "lock", 'a') as lock_file:
+        assert api.try_lock_file(lock_file)
+        api.run_locked_batch_job(job_id)
+
+    assert api.read_job_state(job_id)['status'] == 'queued'
+    assert not results_path(job_id).exists()
+
+
+def test_batch_job_without_rows_is_rejected():
+    header = SAMPLE_CSV.read_text().splitlines()[0] + "\n"
+    response = TestClient(api.app).post(
+        "/predict/batch/jobs", files={"file": ("batch.csv", header.encode('utf-8'))})
+
+    assert response.status_code == 400
+    assert response.json()['detail'] == "The uploaded CSV file contains no rows"